@@ -2,102 +2,24 @@
 # APOGEE Space Club – Mission Game (Separate App)
 # Landing sequence challenge with timer
 
-import os
 import random
 import time
-import json
-from datetime import datetime
 import streamlit as st
+from utils.shared import append_row_to_sheet, add_score, mark_now, seconds_left, format_time
 
 ############################
 # ---- CONFIGURABLES ---- #
 ############################
 MISSION_TIMER_SEC = 45
-LEADERBOARD_FILE = "leaderboard.json"
-SHEET_ENABLED = True
-SHEET_NAME = os.environ.get("APOGEE_SHEET_NAME", "APOGEE_Orientation_Responses")
-GOOGLE_CREDS_JSON = os.environ.get("GOOGLE_APPLICATION_CREDENTIALS_JSON")
-GOOGLE_CREDS_FILE = os.environ.get("GOOGLE_APPLICATION_CREDENTIALS", "service_account.json")
 
 ############################
 # ---- GOOGLE SHEETS ---- #
 ############################
-def get_gspread_client():
-    if not SHEET_ENABLED:
-        return None
-    try:
-        import gspread
-        from google.oauth2.service_account import Credentials
-
-        creds_file = GOOGLE_CREDS_FILE
-        if GOOGLE_CREDS_JSON:
-            creds_file = "_sa_from_env.json"
-            with open(creds_file, "w", encoding="utf-8") as f:
-                f.write(GOOGLE_CREDS_JSON)
-
-        scopes = [
-            "https://www.googleapis.com/auth/spreadsheets",
-            "https://www.googleapis.com/auth/drive",
-        ]
-        credentials = Credentials.from_service_account_file(creds_file, scopes=scopes)
-        client = gspread.authorize(credentials)
-        return client
-    except Exception as e:
-        st.warning(f"Google Sheets disabled: {e}")
-        return None
-
-def append_row_to_sheet(row):
-    if not SHEET_ENABLED:
-        return
-    client = get_gspread_client()
-    if not client:
-        return
-    try:
-        sh = None
-        try:
-            sh = client.open(SHEET_NAME)
-        except Exception:
-            sh = client.create(SHEET_NAME)
-        try:
-            ws = sh.worksheet("Mission_Game")
-        except Exception:
-            ws = sh.add_worksheet(title="Mission_Game", rows=1000, cols=15)
-            ws.append_row([
-                "timestamp", "name", "email", "branch", "astronaut_name",
-                "mission_name", "mission_correct", "time_left_seconds", 
-                "user_sequence", "correct_sequence", "score", "notes",
-            ])
-        ws.append_row(row)
-    except Exception as e:
-        st.error(f"Sheet error: {e}")
-
-############################
-# ---- LEADERBOARD ---- #
-############################
-def load_leaderboard():
-    if not os.path.exists(LEADERBOARD_FILE):
-        return {"mission_game": [], "quiz_game": []}
-    try:
-        with open(LEADERBOARD_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception:
-        return {"mission_game": [], "quiz_game": []}
-
-def save_leaderboard(data):
-    with open(LEADERBOARD_FILE, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2)
-
-def add_score(game_key, name, branch, nickname, score):
-    data = load_leaderboard()
-    entry = {
-        "name": name,
-        "branch": branch,
-        "nickname": nickname,
-        "score": score,
-        "time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-    }
-    data.setdefault(game_key, []).append(entry)
-    save_leaderboard(data)
+MISSION_SHEET_HEADER = (
+    "timestamp", "name", "email", "branch", "astronaut_name",
+    "mission_name", "mission_correct", "time_left_seconds",
+    "user_sequence", "correct_sequence", "score", "notes",
+)
 
 ############################
 # ---- MISSION DATA ---- #
@@ -140,18 +62,58 @@ MISSIONS = {
         ],
     },
 }
+MISSION_NAMES = tuple(MISSIONS.keys())
+
+# Reference guide lines shown in the mission expander
+MISSION_GUIDE = {
+    "Chandrayaan-2": (
+        "**🌙 Lunar Landing Sequence:**",
+        "• **RCS Thrusters**: Small attitude control rockets",
+        "• **Descent Rate**: Speed of coming down",
+        "• **Main Engine**: Primary propulsion system",
+        "• **Landing Site**: Safe, flat surface area",
+        "• **Braking Burn**: Final slowdown maneuver",
+    ),
+    "Apollo 11": (
+        "**🌕 Eagle Lander Sequence:**",
+        "• **PDI**: Powered Descent Initiation",
+        "• **Pitch Over**: Tilt to see landing site",
+        "• **Boulder Field**: Rocky hazardous area to avoid",
+        "• **Hover**: Stationary flight before touchdown",
+    ),
+    "Gaganyaan": (
+        "**🛰️ Crewed Mission Profile:**",
+        "• **Max-Q**: Maximum aerodynamic pressure",
+        "• **Stage Separation**: Jettison used rocket stages",
+        "• **Crew Module**: Astronaut compartment",
+        "• **De-orbit**: Burn to return to Earth",
+    ),
+}
 
 ############################
 # ---- TIMER FUNCTIONS ---- #
 ############################
-def seconds_left(start_time, duration):
-    elapsed = time.time() - start_time
-    return max(0, int(duration - elapsed))
+@st.fragment(run_every=1)
+def _render_timer(state):
+    # Re-renders on its own every second without rerunning the whole page
+    mark_now()
+    time_left = seconds_left(state["start_time"], MISSION_TIMER_SEC)
+    time_display = format_time(time_left)
+    progress = min(1.0, (MISSION_TIMER_SEC - time_left) / MISSION_TIMER_SEC)
+    st.progress(progress)
 
-def format_time(seconds):
-    mins = seconds // 60
-    secs = seconds % 60
-    return f"{mins:02d}:{secs:02d}"
+    # Color-code the timer
+    if time_left > 20:
+        st.success(f"⏱️ Time Remaining: **{time_display}**")
+    elif time_left > 10:
+        st.warning(f"⏱️ Time Remaining: **{time_display}**")
+    else:
+        st.error(f"⏱️ Time Remaining: **{time_display}**")
+
+    # Auto-end game when time runs out
+    if time_left <= 0 and not state["game_over"]:
+        state["game_over"] = True
+        st.rerun()
 
 ############################
 # ---- MAIN GAME APP ---- #
@@ -162,6 +124,9 @@ st.set_page_config(
     layout="centered"
 )
 
+# One clock reading shared by every timer display in this rerun
+mark_now()
+
 # Check if user data exists
 if "game_user" not in st.session_state:
     st.error("❌ No user data found. Please register first.")
@@ -176,15 +141,23 @@ st.caption(f"Astronaut: **{user['astronaut_name']}** | {user['name']} ({user['br
 
 # Initialize game state only once
 if "mission_state" not in st.session_state:
-    mission_name = random.choice(list(MISSIONS.keys()))
+    mission_name = random.choice(MISSION_NAMES)
     mission = MISSIONS[mission_name]
     
+    options = random.sample(mission["steps_correct"], len(mission["steps_correct"]))
+    button_specs = [(step, f"step_{i}") for i, step in enumerate(options)]
+    
     st.session_state["mission_state"] = {
         "mission_name": mission_name,
         "mission": mission,
-        "options": random.sample(mission["steps_correct"], len(mission["steps_correct"])),
+        "options": options,
+        # (step, widget key) per option button, split into the two grid
+        # columns once per game
+        "button_columns": (button_specs[::2], button_specs[1::2]),
+        "correct_pos": {step: i for i, step in enumerate(mission["steps_correct"])},
         "selected_sequence": [],
-        "start_time": time.time(),
+        "selected_set": set(),
+        "start_time": time.monotonic(),
         "game_over": False,
         "score": 0,
         "data_saved": False
@@ -198,25 +171,10 @@ st.info(state["mission"]["blurb"])
 
 # Calculate time remaining
 time_left = seconds_left(state["start_time"], MISSION_TIMER_SEC)
-time_display = format_time(time_left)
 
 # Show timer and progress (only update if game not over)
 if not state["game_over"]:
-    progress = min(1.0, (MISSION_TIMER_SEC - time_left) / MISSION_TIMER_SEC)
-    st.progress(progress)
-    
-    # Color-code the timer
-    if time_left > 20:
-        st.success(f"⏱️ Time Remaining: **{time_display}**")
-    elif time_left > 10:
-        st.warning(f"⏱️ Time Remaining: **{time_display}**")
-    else:
-        st.error(f"⏱️ Time Remaining: **{time_display}**")
-    
-    # Auto-end game when time runs out
-    if time_left <= 0 and not state["game_over"]:
-        state["game_over"] = True
-        st.rerun()
+    _render_timer(state)
 
     # Show game interface if not completed
     # Add reset button for redoing sequence
@@ -226,51 +184,36 @@ if not state["game_over"]:
     with col2:
         if st.button("🔄 Reset Order") and state["selected_sequence"]:
             state["selected_sequence"] = []
+            state["selected_set"].clear()
             st.rerun()
     
     st.write("📋 **Instructions:** Click the mission steps below in the proper chronological sequence:")
     
     # Mission reference guide
     with st.expander(f"📖 {state['mission_name']} Reference Guide"):
-        if state['mission_name'] == "Chandrayaan-2":
-            st.write("**🌙 Lunar Landing Sequence:**")
-            st.write("• **RCS Thrusters**: Small attitude control rockets")
-            st.write("• **Descent Rate**: Speed of coming down")
-            st.write("• **Main Engine**: Primary propulsion system")
-            st.write("• **Landing Site**: Safe, flat surface area")
-            st.write("• **Braking Burn**: Final slowdown maneuver")
-        elif state['mission_name'] == "Apollo 11":
-            st.write("**🌕 Eagle Lander Sequence:**")
-            st.write("• **PDI**: Powered Descent Initiation")
-            st.write("• **Pitch Over**: Tilt to see landing site")
-            st.write("• **Boulder Field**: Rocky hazardous area to avoid")
-            st.write("• **Hover**: Stationary flight before touchdown")
-        elif state['mission_name'] == "Gaganyaan":
-            st.write("**🛰️ Crewed Mission Profile:**")
-            st.write("• **Max-Q**: Maximum aerodynamic pressure")
-            st.write("• **Stage Separation**: Jettison used rocket stages")
-            st.write("• **Crew Module**: Astronaut compartment")
-            st.write("• **De-orbit**: Burn to return to Earth")
+        for line in MISSION_GUIDE.get(state['mission_name'], ()):
+            st.write(line)
     
     # Display options in a grid
-    cols = st.columns(2)
-    for i, step in enumerate(state["options"]):
-        col = cols[i % 2]
-        # Disable if already selected or time's up
-        disabled = (step in state["selected_sequence"]) or (time_left <= 0)
-        
-        if col.button(
-            step, 
-            key=f"step_{i}", 
-            disabled=disabled,
-            help="Click to add this step to your sequence",
-            use_container_width=True
-        ):
-            state["selected_sequence"].append(step)
-            # Check if sequence is complete
-            if len(state["selected_sequence"]) == len(state["options"]):
-                state["game_over"] = True
-            st.rerun()
+    col1, col2 = st.columns(2)
+    for col, specs in zip((col1, col2), state["button_columns"]):
+        for step, key in specs:
+            # Disable if already selected or time's up
+            disabled = (step in state["selected_set"]) or (time_left <= 0)
+            
+            if col.button(
+                step, 
+                key=key, 
+                disabled=disabled,
+                help="Click to add this step to your sequence",
+                use_container_width=True
+            ):
+                state["selected_sequence"].append(step)
+                state["selected_set"].add(step)
+                # Check if sequence is complete
+                if len(state["selected_sequence"]) == len(state["options"]):
+                    state["game_over"] = True
+                st.rerun()
     
     # Show current sequence
     st.markdown("### 📝 Your Current Sequence:")
@@ -287,7 +230,10 @@ else:
     
     # Calculate score
     correct_sequence = state["mission"]["steps_correct"]
-    is_correct = (state["selected_sequence"] == correct_sequence)
+    correct_pos = state["correct_pos"]
+    # Indices of steps the player placed in the right slot, in a single pass
+    placed = {i for i, step in enumerate(state["selected_sequence"]) if correct_pos[step] == i}
+    is_correct = (len(placed) == len(correct_sequence))
     state["score"] = 1 if is_correct else 0
     
     # Show results
@@ -310,20 +256,20 @@ else:
     
     with col2:
         st.markdown("#### Correct Sequence:")
+        n_selected = len(state["selected_sequence"])
         for idx, step in enumerate(correct_sequence, 1):
             # Highlight correct/incorrect steps
-            if idx <= len(state["selected_sequence"]):
-                if state["selected_sequence"][idx-1] == step:
-                    st.write(f"✅ **{idx}.** {step}")
-                else:
-                    st.write(f"❌ **{idx}.** {step}")
+            if idx - 1 in placed:
+                st.write(f"✅ **{idx}.** {step}")
+            elif idx <= n_selected:
+                st.write(f"❌ **{idx}.** {step}")
             else:
                 st.write(f"**{idx}.** {step}")
     
     # Save data only once
     if not state["data_saved"]:
         # Save to Google Sheets
-        ts = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        ts = time.strftime("%Y-%m-%d %H:%M:%S")
         user_seq = " → ".join(state["selected_sequence"]) if state["selected_sequence"] else "No sequence"
         correct_seq = " → ".join(correct_sequence)
         row = [
@@ -331,10 +277,10 @@ else:
             state["mission_name"], str(is_correct), str(time_left),
             user_seq, correct_seq, str(state["score"]), "Mission Game Completed"
         ]
-        append_row_to_sheet(row)
+        append_row_to_sheet(row, "Mission_Game", MISSION_SHEET_HEADER)
         
         # Save to leaderboard
-        add_score("mission_game", user["name"], user["branch"], user["astronaut_name"], state["score"])
+        add_score("mission_game", user["name"], user["branch"], user["astronaut_name"], state["score"], ts)
         
         state["data_saved"] = True
         st.success("✅ Results saved successfully!")
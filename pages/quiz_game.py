@@ -2,102 +2,24 @@
 # APOGEE Space Club – Quiz Game (Separate App) 
 # Multiple choice space knowledge quiz
 
-import os
 import random
 import time
-import json
-from datetime import datetime
 import streamlit as st
+from utils.shared import append_row_to_sheet, add_score, mark_now, seconds_left, format_time
 
 ############################
 # ---- CONFIGURABLES ---- #
 ############################
 QUIZ_TIMER_SEC = 15
-LEADERBOARD_FILE = "leaderboard.json" 
-SHEET_ENABLED = True
-SHEET_NAME = os.environ.get("APOGEE_SHEET_NAME", "APOGEE_Orientation_Responses")
-GOOGLE_CREDS_JSON = os.environ.get("GOOGLE_APPLICATION_CREDENTIALS_JSON")
-GOOGLE_CREDS_FILE = os.environ.get("GOOGLE_APPLICATION_CREDENTIALS", "service_account.json")
 
 ############################
 # ---- GOOGLE SHEETS ---- #
 ############################
-def get_gspread_client():
-    if not SHEET_ENABLED:
-        return None
-    try:
-        import gspread
-        from google.oauth2.service_account import Credentials
-
-        creds_file = GOOGLE_CREDS_FILE
-        if GOOGLE_CREDS_JSON:
-            creds_file = "_sa_from_env.json"
-            with open(creds_file, "w", encoding="utf-8") as f:
-                f.write(GOOGLE_CREDS_JSON)
-
-        scopes = [
-            "https://www.googleapis.com/auth/spreadsheets", 
-            "https://www.googleapis.com/auth/drive",
-        ]
-        credentials = Credentials.from_service_account_file(creds_file, scopes=scopes)
-        client = gspread.authorize(credentials)
-        return client
-    except Exception as e:
-        st.warning(f"Google Sheets disabled: {e}")
-        return None
-
-def append_row_to_sheet(row):
-    if not SHEET_ENABLED:
-        return
-    client = get_gspread_client()
-    if not client:
-        return
-    try:
-        sh = None
-        try:
-            sh = client.open(SHEET_NAME)
-        except Exception:
-            sh = client.create(SHEET_NAME)
-        try:
-            ws = sh.worksheet("Quiz_Game")
-        except Exception:
-            ws = sh.add_worksheet(title="Quiz_Game", rows=1000, cols=15)
-            ws.append_row([
-                "timestamp", "name", "email", "branch", "astronaut_name",
-                "total_questions", "correct_answers", "score", "question_ids",
-                "user_answers", "correct_answers_detail", "time_taken", "notes",
-            ])
-        ws.append_row(row)
-    except Exception as e:
-        st.error(f"Sheet error: {e}")
-
-############################
-# ---- LEADERBOARD ---- #
-############################
-def load_leaderboard():
-    if not os.path.exists(LEADERBOARD_FILE):
-        return {"mission_game": [], "quiz_game": []}
-    try:
-        with open(LEADERBOARD_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception:
-        return {"mission_game": [], "quiz_game": []}
-
-def save_leaderboard(data):
-    with open(LEADERBOARD_FILE, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2)
-
-def add_score(game_key, name, branch, nickname, score):
-    data = load_leaderboard()
-    entry = {
-        "name": name,
-        "branch": branch,
-        "nickname": nickname,
-        "score": score,
-        "time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-    }
-    data.setdefault(game_key, []).append(entry)
-    save_leaderboard(data)
+QUIZ_SHEET_HEADER = (
+    "timestamp", "name", "email", "branch", "astronaut_name",
+    "total_questions", "correct_answers", "score", "question_ids",
+    "user_answers", "correct_answers_detail", "time_taken", "notes",
+)
 
 ############################
 # ---- QUIZ DATA ---- #
@@ -153,18 +75,31 @@ QUIZ_POOL = [
         "explain": "In vacuum, only radiation can transfer heat (no medium for conduction/convection)"
     }
 ]
+_QUIZ_N = min(3, len(QUIZ_POOL))  # questions per quiz session
 
 ############################
 # ---- TIMER FUNCTIONS ---- #
 ############################
-def seconds_left(start_time, duration):
-    elapsed = time.time() - start_time
-    return max(0, int(duration - elapsed))
+def _timer_banner(time_left):
+    time_display = format_time(time_left)
+    if time_left > 10:
+        st.success(f"⏱️ Time Remaining: **{time_display}**")
+    elif time_left > 5:
+        st.warning(f"⏱️ Time Remaining: **{time_display}**")
+    else:
+        st.error(f"⏱️ Time Remaining: **{time_display}**")
 
-def format_time(seconds):
-    mins = seconds // 60
-    secs = seconds % 60
-    return f"{mins:02d}:{secs:02d}"
+@st.fragment(run_every=1)
+def _render_timer(state):
+    # Re-renders on its own every second without rerunning the whole page;
+    # only rendered while the current question is still open
+    mark_now()
+    time_left = seconds_left(state["question_start_time"], QUIZ_TIMER_SEC)
+    _timer_banner(time_left)
+
+    # Full rerun on timeout so the page below auto-submits the answer
+    if time_left <= 0:
+        st.rerun()
 
 ############################
 # ---- MAIN QUIZ APP ---- #
@@ -175,6 +110,9 @@ st.set_page_config(
     layout="centered"
 )
 
+# One clock reading shared by every timer display in this rerun
+mark_now()
+
 # Check if user data exists
 if "game_user" not in st.session_state:
     st.error("❌ No user data found. Please register first.")
@@ -190,14 +128,21 @@ st.caption(f"Astronaut: **{user['astronaut_name']}** | {user['name']} ({user['br
 # Initialize quiz state only once
 if "quiz_state" not in st.session_state:
     # Select 3 random questions for this quiz session
-    selected_questions = random.sample(QUIZ_POOL, min(3, len(QUIZ_POOL)))
+    selected_questions = [
+        {
+            **q,
+            "option_index": {opt: i for i, opt in enumerate(q["options"])},
+            "correct_text": q["options"][q["answer_idx"]],
+        }
+        for q in random.sample(QUIZ_POOL, _QUIZ_N)
+    ]
     
     st.session_state["quiz_state"] = {
         "questions": selected_questions,
         "current_question": 0,
         "answers": [],
-        "start_time": time.time(),
-        "question_start_time": time.time(),
+        "start_time": time.monotonic(),
+        "question_start_time": time.monotonic(),
         "quiz_complete": False,
         "data_saved": False,
         "selected_answer": None,
@@ -230,7 +175,7 @@ if state["quiz_complete"]:
         with st.expander(f"Question {i+1}: {'✅' if answer['correct'] else '❌'}"):
             st.write(f"**Q:** {question['q']}")
             st.write(f"**Your Answer:** {answer['user_answer']}")
-            st.write(f"**Correct Answer:** {question['options'][question['answer_idx']]}")
+            st.write(f"**Correct Answer:** {question['correct_text']}")
             if answer['correct']:
                 st.success("✅ Correct!")
             else:
@@ -240,12 +185,12 @@ if state["quiz_complete"]:
     
     # Save data only once
     if not state["data_saved"]:
-        ts = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        ts = time.strftime("%Y-%m-%d %H:%M:%S")
         
         # Prepare consolidated data for single sheet entry
         question_ids = [q["id"] for q in state["questions"]]
         user_answers = [ans["user_answer"] for ans in state["answers"]]
-        correct_answers_detail = [state["questions"][i]["options"][state["questions"][i]["answer_idx"]] for i in range(len(state["questions"]))]
+        correct_answers_detail = [q["correct_text"] for q in state["questions"]]
         total_time_taken = sum(QUIZ_TIMER_SEC - ans["time_left"] for ans in state["answers"])
         
         # Single row for entire quiz session
@@ -255,10 +200,10 @@ if state["quiz_complete"]:
             " | ".join(user_answers), " | ".join(correct_answers_detail), str(total_time_taken),
             f"Quiz completed with {correct_count}/{total_questions} correct answers"
         ]
-        append_row_to_sheet(row)
+        append_row_to_sheet(row, "Quiz_Game", QUIZ_SHEET_HEADER)
         
         # Save to leaderboard
-        add_score("quiz_game", user["name"], user["branch"], user["astronaut_name"], correct_count)
+        add_score("quiz_game", user["name"], user["branch"], user["astronaut_name"], correct_count, ts)
         
         state["data_saved"] = True
         st.success("✅ Results saved successfully!")
@@ -295,7 +240,6 @@ else:
     
     # Timer for current question
     time_left = seconds_left(state["question_start_time"], QUIZ_TIMER_SEC)
-    time_display = format_time(time_left)
     
     # Progress indicator
     progress = (state["current_question"] + 1) / len(state["questions"])
@@ -304,13 +248,11 @@ else:
     # Question header
     st.markdown(f"### Question {state['current_question'] + 1} of {len(state['questions'])}")
     
-    # Timer display
-    if time_left > 10:
-        st.success(f"⏱️ Time Remaining: **{time_display}**")
-    elif time_left > 5:
-        st.warning(f"⏱️ Time Remaining: **{time_display}**")
+    # Timer display: live while answering, frozen at the submitted value after
+    if state["answer_submitted"]:
+        _timer_banner(state["answers"][-1]["time_left"])
     else:
-        st.error(f"⏱️ Time Remaining: **{time_display}**")
+        _render_timer(state)
     
     # Show question
     st.markdown("---")
@@ -326,26 +268,20 @@ else:
         selected = st.radio(
             "Choose your answer:",
             current_q_data["options"],
-            index=current_q_data["options"].index(state["selected_answer"]),
+            index=current_q_data["option_index"][state["selected_answer"]],
             key=f"q_{state['current_question']}_radio"
         )
         state["selected_answer"] = selected
         
         # Submit button or auto-submit on timeout
-        col1, col2 = st.columns([3, 1])
-        
-        with col1:
-            submit_clicked = st.button("✅ Submit Answer", use_container_width=True, type="primary", disabled=(time_left <= 0))
-        
-        with col2:
-            st.metric("Time", time_display)
+        submit_clicked = st.button("✅ Submit Answer", use_container_width=True, type="primary", disabled=(time_left <= 0))
         
         # Auto-submit when time runs out
         if time_left <= 0 or submit_clicked:
             # Process the answer
             user_answer = state["selected_answer"]
             correct_idx = current_q_data["answer_idx"]
-            is_correct = (current_q_data["options"].index(user_answer) == correct_idx)
+            is_correct = (current_q_data["option_index"][user_answer] == correct_idx)
             
             # Store answer
             state["answers"].append({
@@ -366,7 +302,7 @@ else:
             st.success("🎉 **Correct!** Well done!")
         else:
             st.error("❌ **Incorrect**")
-            st.info(f"**Correct Answer:** {current_q_data['options'][current_q_data['answer_idx']]}")
+            st.info(f"**Correct Answer:** {current_q_data['correct_text']}")
             st.info(f"💡 **Explanation:** {current_q_data['explain']}")
         
         # Next question or finish
@@ -374,7 +310,7 @@ else:
             if st.button("➡️ Next Question", use_container_width=True, type="primary"):
                 # Move to next question
                 state["current_question"] += 1
-                state["question_start_time"] = time.time()
+                state["question_start_time"] = time.monotonic()
                 state["selected_answer"] = None
                 state["answer_submitted"] = False
                 st.rerun()
@@ -2,96 +2,122 @@
 # APOGEE Space Club – Main Hub
 # Centralized Google Sheets leaderboard
 
+import io
 import os
-from datetime import datetime
+import time
+import heapq
 import streamlit as st
-import gspread
-from google.oauth2.service_account import Credentials
+from utils.shared import (
+    _get_worksheet, generate_fun_nickname, get_credentials,
+    get_gspread_client as shared_gspread_client,
+)
 
 ############################
 # ---- CONFIGURABLES ---- #
 ############################
 APP_TITLE = "APOGEE Space Club – Cadet Trials 🚀"
 SHEET_NAME = os.environ.get("APOGEE_SHEET_NAME", "Apogee_Cadet_Trials")
+# Optional spreadsheet key; when set the sheet is opened directly instead of
+# searched for by title
+SHEET_ID = os.environ.get("APOGEE_SHEET_ID")
 WORKSHEET_NAME = "Leaderboard"
 
 ############################
 # ---- GOOGLE SHEETS ---- #
 ############################
+LEADERBOARD_HEADER = ("Game", "Nickname", "Name", "Branch", "Score", "Time")
+
+@st.cache_resource(show_spinner=False)
+def _authorized_session():
+    from google.auth.transport.requests import AuthorizedSession
+
+    return AuthorizedSession(get_credentials())
+
 def get_gspread_client():
+    # Failures are not cached, so a fixed credentials file is picked up on retry
     try:
-        creds_file = "service_account.json"
-        scopes = ["https://www.googleapis.com/auth/spreadsheets",
-                  "https://www.googleapis.com/auth/drive"]
-        credentials = Credentials.from_service_account_file(creds_file, scopes=scopes)
-        client = gspread.authorize(credentials)
-        return client
+        client = shared_gspread_client()
     except Exception as e:
         st.error(f"❌ Google Sheets auth failed: {e}")
         return None
+    if not client:
+        st.error("❌ Google Sheets auth failed: no service-account credentials configured")
+    return client
+
+def _get_leaderboard_worksheet():
+    return _get_worksheet(SHEET_NAME, WORKSHEET_NAME, LEADERBOARD_HEADER, SHEET_ID)
 
 def save_to_google_sheets(game, entry):
-    client = get_gspread_client()
-    if not client:
+    if not get_gspread_client():
         return
     try:
-        sh = None
-        try:
-            sh = client.open(SHEET_NAME)
-        except Exception:
-            sh = client.create(SHEET_NAME)
-        try:
-            ws = sh.worksheet(WORKSHEET_NAME)
-        except Exception:
-            ws = sh.add_worksheet(title=WORKSHEET_NAME, rows=1000, cols=10)
-            ws.append_row(["Game", "Nickname", "Name", "Branch", "Score", "Time"])
-        ws.append_row([
+        ws = _get_leaderboard_worksheet()
+        ws.append_rows([[
             game,
             entry["nickname"],
             entry["name"],
             entry["branch"],
             entry["score"],
-            entry.get("time", datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
-        ])
+            entry.get("time") or time.strftime("%Y-%m-%d %H:%M:%S")
+        ]], value_input_option="RAW", insert_data_option="INSERT_ROWS", table_range="A1")
+        _fetch_leaderboard.clear()
     except Exception as e:
         st.error(f"❌ Error saving to Google Sheets: {e}")
 
+def _read_leaderboard_csv(ws):
+    # The CSV export is parsed by pandas' C reader, far cheaper than decoding
+    # the JSON values payload cell by cell
+    import pandas as pd
+
+    url = (f"https://docs.google.com/spreadsheets/d/{ws.spreadsheet.id}"
+           f"/export?format=csv&gid={ws.id}")
+    resp = _authorized_session().get(url)
+    resp.raise_for_status()
+    df = pd.read_csv(io.BytesIO(resp.content), usecols=range(len(LEADERBOARD_HEADER)),
+                     dtype=str, keep_default_na=False)
+    return df.itertuples(index=False, name=None)
+
+@st.cache_data(ttl=60, show_spinner="Loading leaderboard…")
+def _fetch_leaderboard():
+    # Errors propagate so a failed load is never cached for the whole TTL
+    from requests import RequestException
+
+    ws = _get_leaderboard_worksheet()
+    try:
+        rows = _read_leaderboard_csv(ws)
+    except (RequestException, ValueError) as e:
+        # ValueError covers pandas' ParserError/EmptyDataError and usecols
+        # mismatches, e.g. an HTML login page instead of the CSV export
+        print(f"Leaderboard CSV export failed, using get_all_values: {e}")
+        # rows[0] is the header; columns follow LEADERBOARD_HEADER order
+        rows = (r[:6] for r in ws.get_all_values()[1:])
+    data = {"mission_game": [], "quiz_game": []}
+    for game, nickname, name, branch, score, played_at in rows:
+        if game not in data:
+            continue
+        data[game].append({
+            "nickname": nickname,
+            "name": name,
+            "branch": branch,
+            "score": int(score or 0),
+            "time": played_at
+        })
+    return data
+
 def load_leaderboard():
-    client = get_gspread_client()
-    if not client:
+    if not get_gspread_client():
         return {"mission_game": [], "quiz_game": []}
     try:
-        sh = client.open(SHEET_NAME)
-        ws = sh.worksheet(WORKSHEET_NAME)
-        rows = ws.get_all_records()
-        data = {"mission_game": [], "quiz_game": []}
-        for row in rows:
-            entry = {
-                "nickname": row.get("Nickname"),
-                "name": row.get("Name"),
-                "branch": row.get("Branch"),
-                "score": int(row.get("Score", 0)),
-                "time": row.get("Time")
-            }
-            if row.get("Game") == "mission_game":
-                data["mission_game"].append(entry)
-            elif row.get("Game") == "quiz_game":
-                data["quiz_game"].append(entry)
-        return data
+        return _fetch_leaderboard()
     except Exception as e:
         st.error(f"❌ Error loading leaderboard: {e}")
         return {"mission_game": [], "quiz_game": []}
 
-############################
-# ---- NICKNAME GEN ---- #
-############################
-def generate_fun_nickname(name: str) -> str:
-    base = (name.strip().split()[0] if name.strip() else "Cadet").lower()
-    base = "".join(ch for ch in base if ch.isalpha())[:5].capitalize()
-    prefixes = ["Zap", "Neo", "Geo", "Vex", "Blu", "Zen", "Pyro", "Quip", "Nova", "Tiki"]
-    suffixes = ["tron", "pop", "bit", "do", "ster", "zo", "ly", "ix", "o", "a"]
-    h = sum(ord(c) for c in name) if name else 999
-    return f"{prefixes[h % len(prefixes)]}{base}{suffixes[(h // len(prefixes)) % len(suffixes)]}"
+def _mission_rank_key(entry):
+    return (-entry["score"], entry.get("time", ""))
+
+def _quiz_rank_key(entry):
+    return -entry["score"]
 
 ############################
 # ---- MAIN APP ---- #
@@ -115,14 +141,15 @@ if st.session_state["page"] == "form":
         agree = st.checkbox("I agree to share my details with APOGEE Space Club")
         submitted = st.form_submit_button("🚀 Start Cadet Trials", use_container_width=True)
     if submitted:
-        if not (name and email and branch and agree):
+        name_s, email_s, branch_s = name.strip(), email.strip(), branch.strip()
+        if not (name_s and email_s and branch_s and agree):
             st.error("⚠️ Please fill all required fields and provide consent.")
         else:
-            nickname = generate_fun_nickname(name)
+            nickname = generate_fun_nickname(name_s)
             st.session_state["user"] = {
-                "name": name.strip(),
-                "email": email.strip(),
-                "branch": branch.strip(),
+                "name": name_s,
+                "email": email_s,
+                "branch": branch_s,
                 "astronaut_name": nickname,
             }
             st.session_state["page"] = "menu"
@@ -158,20 +185,25 @@ elif st.session_state["page"] == "menu":
 
 # === Leaderboard ===
 elif st.session_state["page"] == "leaderboard":
-    st.subheader("🏆 Leaderboards")
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        st.subheader("🏆 Leaderboards")
+    with col2:
+        if st.button("🔄 Refresh", use_container_width=True):
+            _fetch_leaderboard.clear()
     data = load_leaderboard()
     tab1, tab2 = st.tabs(["🚀 Mission Game", "🛰️ Quiz Game"])
     with tab1:
         if data.get("mission_game"):
-            sorted_missions = sorted(data["mission_game"], key=lambda x: (-x["score"], x.get("time", "")))
-            for i, entry in enumerate(sorted_missions[:10], 1):
+            top_missions = heapq.nsmallest(10, data["mission_game"], key=_mission_rank_key)
+            for i, entry in enumerate(top_missions, 1):
                 st.write(f"**{i}.** {entry['nickname']} - {entry['name']} ({entry['branch']}) | {entry['score']} | {entry['time']}")
         else:
             st.info("🚀 No mission attempts yet.")
     with tab2:
         if data.get("quiz_game"):
-            sorted_quiz = sorted(data["quiz_game"], key=lambda x: -x["score"])
-            for i, entry in enumerate(sorted_quiz[:10], 1):
+            top_quiz = heapq.nsmallest(10, data["quiz_game"], key=_quiz_rank_key)
+            for i, entry in enumerate(top_quiz, 1):
                 st.write(f"**{i}.** {entry['nickname']} - {entry['name']} ({entry['branch']}) | {entry['score']}")
         else:
             st.info("🛰️ No quiz attempts yet.")
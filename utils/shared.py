@@ -3,144 +3,342 @@
 
 import os
 import json
-from datetime import datetime
+import zlib
+import time
+import random
+import atexit
+import functools
+import queue
+import threading
+from contextlib import contextmanager
+import streamlit as st
+
+try:
+    import fcntl
+except ImportError:  # Windows: no flock, fall back to unguarded writes
+    fcntl = None
+
+try:
+    import orjson
+except ImportError:  # optional speedup, stdlib json otherwise
+    orjson = None
 
 ############################
 # ---- CONFIGURABLES ---- #
 ############################
-LEADERBOARD_FILE = "leaderboard.json"
+LEADERBOARD_FILE = "leaderboard.jsonl"
+LEGACY_LEADERBOARD_FILE = "leaderboard.json"
 SHEET_ENABLED = True
 SHEET_NAME = os.environ.get("APOGEE_SHEET_NAME", "APOGEE_Orientation_Responses")
 GOOGLE_CREDS_JSON = os.environ.get("GOOGLE_APPLICATION_CREDENTIALS_JSON")
 GOOGLE_CREDS_FILE = os.environ.get("GOOGLE_APPLICATION_CREDENTIALS", "service_account.json")
+SHEETS_SCOPES = (
+    "https://www.googleapis.com/auth/spreadsheets",
+    "https://www.googleapis.com/auth/drive",
+)
+SHEET_WRITE_ATTEMPTS = 5
+SHEET_RETRY_STATUS = (429, 500, 503)
+SHEET_EXIT_TIMEOUT = 30  # seconds to let queued rows finish at shutdown
 
 ############################
 # ---- GOOGLE SHEETS ---- #
 ############################
-def get_gspread_client():
-    """Get authenticated Google Sheets client"""
-    if not SHEET_ENABLED:
-        return None
+RESPONSES_HEADER = (
+    "timestamp", "name", "email", "branch", "astronaut_name",
+    "mission_or_q", "mission_correct", "mission_time_left",
+    "physics_qid", "physics_correct", "physics_time_left", "notes",
+)
+
+def _secrets_service_account():
+    # Same [connections.gsheets] block st.connection("gsheets") reads.
+    # load_if_toml_exists() honours the secrets.files option and, unlike
+    # indexing st.secrets, draws no error box when no secrets file exists
     try:
-        import gspread
-        from google.oauth2.service_account import Credentials
-
-        creds_file = GOOGLE_CREDS_FILE
-        if GOOGLE_CREDS_JSON:
-            creds_file = "_sa_from_env.json"
-            with open(creds_file, "w", encoding="utf-8") as f:
-                f.write(GOOGLE_CREDS_JSON)
-
-        scopes = [
-            "https://www.googleapis.com/auth/spreadsheets",
-            "https://www.googleapis.com/auth/drive",
-        ]
-        credentials = Credentials.from_service_account_file(creds_file, scopes=scopes)
-        client = gspread.authorize(credentials)
-        return client
-    except Exception as e:
-        print(f"Google Sheets client error: {e}")
+        if not st.secrets.load_if_toml_exists():
+            return None
+        return dict(st.secrets["connections"]["gsheets"])
+    except Exception:
         return None
 
-def append_row_to_sheet(row):
-    """Append a row to the Google Sheet (thread-safe)"""
-    if not SHEET_ENABLED:
-        return
-    
+# Evaluated once at import: skip the gspread/google-auth imports entirely
+# when no credentials are configured
+_SHEETS_OK = SHEET_ENABLED and bool(
+    GOOGLE_CREDS_JSON or os.path.exists(GOOGLE_CREDS_FILE) or _secrets_service_account()
+)
+
+@st.cache_resource(show_spinner=False)
+def get_credentials():
+    """Service-account credentials from secrets.toml, the env JSON or the key file"""
+    from google.oauth2.service_account import Credentials
+
+    info = _secrets_service_account()
+    if not info and GOOGLE_CREDS_JSON:
+        info = json.loads(GOOGLE_CREDS_JSON)
+    if info:
+        return Credentials.from_service_account_info(info, scopes=SHEETS_SCOPES)
+    return Credentials.from_service_account_file(GOOGLE_CREDS_FILE, scopes=SHEETS_SCOPES)
+
+@st.cache_resource(show_spinner=False)
+def get_gspread_client():
+    """Get authenticated Google Sheets client (built once per process)"""
+    if not _SHEETS_OK:
+        return None
+    # Auth errors propagate instead of returning None, so a failure is not
+    # cached and the next write retries
+    import gspread
+
+    return gspread.authorize(get_credentials())
+
+@st.cache_resource(show_spinner=False)
+def _get_worksheet(sheet_name, ws_title, header, sheet_id=None):
+    """Open (or create) a worksheet once and reuse the handle"""
+    import gspread
+
     client = get_gspread_client()
     if not client:
-        return
-        
+        return None
+    # Only a genuinely missing sheet is created; quota or network errors
+    # raise, so the handle is not cached against the wrong spreadsheet
+    if sheet_id:
+        # Opening by key skips the Drive search by title
+        sh = client.open_by_key(sheet_id)
+    else:
+        try:
+            sh = client.open(sheet_name)
+        except gspread.SpreadsheetNotFound:
+            sh = client.create(sheet_name)
     try:
-        # Open or create spreadsheet
+        ws = sh.worksheet(ws_title)
+    except gspread.WorksheetNotFound:
+        ws = sh.add_worksheet(title=ws_title, rows=1000, cols=20)
+        ws.append_row(list(header), value_input_option="RAW")
+    return ws
+
+# Module-level rather than st.cache_resource: "Clear cache" must not start a
+# second writer and orphan the first
+_sheet_queue = None
+_sheet_queue_lock = threading.Lock()
+
+def _get_sheet_queue():
+    """One queue + daemon writer thread per process"""
+    global _sheet_queue
+    with _sheet_queue_lock:
+        if _sheet_queue is None:
+            _sheet_queue = queue.Queue()
+            threading.Thread(target=_sheet_writer, args=(_sheet_queue,), daemon=True).start()
+            atexit.register(_wait_for_sheet_writer, _sheet_queue)
+    return _sheet_queue
+
+def _wait_for_sheet_writer(q):
+    # The writer calls task_done() once a batch is written, so join() also
+    # covers the batch it is holding; bounded so shutdown cannot hang
+    waiter = threading.Thread(target=q.join, daemon=True)
+    waiter.start()
+    waiter.join(SHEET_EXIT_TIMEOUT)
+
+def _append_rows_with_retry(ws, rows):
+    """append_rows with exponential backoff on quota and transient errors"""
+    from gspread.exceptions import APIError
+
+    for attempt in range(SHEET_WRITE_ATTEMPTS):
         try:
-            sh = client.open(SHEET_NAME)
-        except Exception:
-            sh = client.create(SHEET_NAME)
-        
-        # Open or create worksheet
+            ws.append_rows(rows, value_input_option="RAW",
+                           insert_data_option="INSERT_ROWS", table_range="A1")
+            return
+        except APIError as e:
+            if (e.response.status_code not in SHEET_RETRY_STATUS
+                    or attempt == SHEET_WRITE_ATTEMPTS - 1):
+                raise
+            time.sleep(2 ** attempt + random.random())
+
+def _write_pending_rows(q, batch=None):
+    """Drain the queue and send one append_rows call per worksheet"""
+    batch = batch or []
+    while True:
         try:
-            ws = sh.worksheet("Responses")
-        except Exception:
-            ws = sh.add_worksheet(title="Responses", rows=1000, cols=20)
-            # Add header row
-            header = [
-                "timestamp", "name", "email", "branch", "astronaut_name",
-                "mission_or_q", "mission_correct", "mission_time_left",
-                "physics_qid", "physics_correct", "physics_time_left", "notes",
-            ]
-            ws.append_row(header)
-        
-        # Append the data row
-        ws.append_row(row)
-        
+            batch.append(q.get_nowait())
+        except queue.Empty:
+            break
+
+    by_worksheet = {}
+    for ws_title, header, row in batch:
+        by_worksheet.setdefault((ws_title, header), []).append(row)
+
+    for (ws_title, header), rows in by_worksheet.items():
+        try:
+            ws = _get_worksheet(SHEET_NAME, ws_title, header)
+            if ws:
+                _append_rows_with_retry(ws, rows)
+        except Exception as e:
+            print(f"Error appending to sheet: {e}")
+
+    for _ in batch:
+        q.task_done()
+
+def _sheet_writer(q):
+    # gspread/google-auth are imported and authorized here, on the writer
+    # thread, so the Streamlit script thread never pays for them
+    try:
+        get_gspread_client()
     except Exception as e:
-        print(f"Error appending to sheet: {e}")
+        print(f"Google Sheets client error: {e}")
+    while True:
+        item = q.get()
+        # Rows queued while the previous write was in flight go out together
+        _write_pending_rows(q, [item])
+
+def append_row_to_sheet(row, ws_title="Responses", header=RESPONSES_HEADER):
+    """Queue a row for the Google Sheet; written by a background thread"""
+    if not _SHEETS_OK:
+        return
+    _get_sheet_queue().put((ws_title, tuple(header), row))
 
 ############################
 # ---- LEADERBOARD ---- #
 ############################
+@contextmanager
+def _leaderboard_lock():
+    """Exclusive lock for leaderboard writes across sessions"""
+    with open(LEADERBOARD_FILE + ".lock", "w") as lock_file:
+        if fcntl:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        yield
+
+_legacy_checked = False
+_legacy_checked_lock = threading.Lock()
+
+def _migrate_legacy_leaderboard():
+    """One-time conversion of the old leaderboard.json into JSON lines"""
+    global _legacy_checked
+    if _legacy_checked:
+        return
+    # Other sessions block here until the migration is done, so none of
+    # them can append first and make the legacy file look already migrated
+    with _legacy_checked_lock:
+        if _legacy_checked:
+            return
+        if os.path.exists(LEADERBOARD_FILE) or not os.path.exists(LEGACY_LEADERBOARD_FILE):
+            _legacy_checked = True
+            return
+        with _leaderboard_lock():
+            # Another process may have migrated while we waited for the lock
+            if not os.path.exists(LEADERBOARD_FILE):
+                try:
+                    with open(LEGACY_LEADERBOARD_FILE, "r", encoding="utf-8") as f:
+                        data = json.load(f)
+                except Exception:
+                    data = {}
+                save_leaderboard(data)
+        # save_leaderboard only logs failures; retry on the next call if so
+        _legacy_checked = os.path.exists(LEADERBOARD_FILE)
+
+def _entry_line(game_key, entry):
+    """Serialize one leaderboard entry as a compact UTF-8 JSON line"""
+    record = {"game": game_key, **entry}
+    if orjson:
+        return orjson.dumps(record) + b"\n"
+    return json.dumps(record, separators=(",", ":"), ensure_ascii=False).encode("utf-8") + b"\n"
+
+_json_loads = orjson.loads if orjson else json.loads
+
+@st.cache_data(show_spinner=False, max_entries=1)
+def _load_leaderboard_cached(mtime):
+    # mtime is only the cache key: any write to the file invalidates it, and
+    # max_entries=1 drops the stale copy left by writes from other processes
+    data = {"mission_game": [], "quiz_game": []}
+    try:
+        with open(LEADERBOARD_FILE, "rb") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                # A torn or partial line only costs that one entry
+                try:
+                    entry = _json_loads(line)
+                    game_key = entry.pop("game")
+                except (ValueError, KeyError, AttributeError):
+                    continue
+                data.setdefault(game_key, []).append(entry)
+    except OSError:
+        pass
+    return data
+
 def load_leaderboard():
-    """Load leaderboard data from JSON file"""
-    if not os.path.exists(LEADERBOARD_FILE):
-        return {"mission_game": [], "quiz_game": []}
+    """Load leaderboard data from the JSON lines file"""
+    _migrate_legacy_leaderboard()
     try:
-        with open(LEADERBOARD_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception:
+        mtime = os.path.getmtime(LEADERBOARD_FILE)
+    except FileNotFoundError:
         return {"mission_game": [], "quiz_game": []}
+    return _load_leaderboard_cached(mtime)
 
 def save_leaderboard(data):
-    """Save leaderboard data to JSON file"""
+    """Atomically rewrite the whole leaderboard file from a {game: [entries]} dict"""
+    tmp_file = LEADERBOARD_FILE + ".tmp"
     try:
-        with open(LEADERBOARD_FILE, "w", encoding="utf-8") as f:
-            json.dump(data, f, indent=2)
+        with open(tmp_file, "wb", buffering=64 * 1024) as f:
+            f.writelines(
+                _entry_line(game_key, entry)
+                for game_key, entries in data.items()
+                for entry in entries
+            )
+        os.replace(tmp_file, LEADERBOARD_FILE)
     except Exception as e:
         print(f"Error saving leaderboard: {e}")
 
-def add_score(game_key, name, branch, nickname, score):
-    """Add a score entry to the leaderboard"""
-    data = load_leaderboard()
+def add_score(game_key, name, branch, nickname, score, ts=None):
+    """Append a score entry to the leaderboard (ts: preformatted timestamp)"""
+    _migrate_legacy_leaderboard()
     entry = {
         "name": name,
         "branch": branch,
         "nickname": nickname,
         "score": score,
-        "time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "time": ts or time.strftime("%Y-%m-%d %H:%M:%S"),
     }
-    data.setdefault(game_key, []).append(entry)
-    save_leaderboard(data)
+    # Append-only: one short O_APPEND write per score, no read-modify-write.
+    # The lock keeps lines whole on filesystems where O_APPEND is not atomic
+    # (e.g. network mounts)
+    line = _entry_line(game_key, entry)
+    with _leaderboard_lock(), open(LEADERBOARD_FILE, "ab") as f:
+        f.write(line)
+    _load_leaderboard_cached.clear()
 
 ############################
 # ---- NICKNAME GEN ---- #
 ############################
+NICK_PREFIXES = ("Zap", "Neo", "Geo", "Vex", "Blu", "Zen", "Pyro", "Quip", "Nova", "Tiki")
+NICK_SUFFIXES = ("tron", "pop", "bit", "do", "ster", "zo", "ly", "ix", "o", "a")
+
 def generate_fun_nickname(name: str) -> str:
     """Generate a fun astronaut nickname from real name"""
-    base = (name.strip().split()[0] if name.strip() else "Cadet").lower()
-    base = "".join(ch for ch in base if ch.isalpha())[:5].capitalize()
-    
-    prefixes = ["Zap", "Neo", "Geo", "Vex", "Blu", "Zen", "Pyro", "Quip", "Nova", "Tiki"]
-    suffixes = ["tron", "pop", "bit", "do", "ster", "zo", "ly", "ix", "o", "a"]
-    
-    # Deterministic based on name hash
-    h = sum(ord(c) for c in name) if name else 999
-    p = prefixes[h % len(prefixes)]
-    s = suffixes[(h // len(prefixes)) % len(suffixes)]
-    
+    words = name.split()
+    base = "".join(filter(str.isalpha, words[0] if words else "Cadet"))[:5].capitalize()
+
+    # Deterministic based on name hash (stable across restarts)
+    h = zlib.crc32(name.encode("utf-8")) if name else 999
+    p = NICK_PREFIXES[h % len(NICK_PREFIXES)]
+    s = NICK_SUFFIXES[(h // len(NICK_PREFIXES)) % len(NICK_SUFFIXES)]
+
     return f"{p}{base}{s}"
 
 ############################
 # ---- TIME UTILS ---- #
 ############################
-import time
+def mark_now():
+    """Snapshot the monotonic clock once per (fragment) rerun"""
+    now = time.monotonic()
+    st.session_state["_now"] = now
+    return now
 
 def seconds_left(start_time, duration):
-    """Calculate seconds remaining from start time"""
-    elapsed = time.time() - start_time
-    return max(0, int(duration - elapsed))
+    """Calculate seconds remaining from a time.monotonic() start time"""
+    now = st.session_state.get("_now")
+    if now is None:
+        now = time.monotonic()
+    return max(0, int(duration - (now - start_time)))
 
+@functools.lru_cache(maxsize=256)
 def format_time(seconds):
     """Format seconds as MM:SS"""
-    mins = seconds // 60
-    secs = seconds % 60
-    return f"{mins:02d}:{secs:02d}"
\ No newline at end of file
+    mins, secs = divmod(int(seconds), 60)
+    return f"{mins:02d}:{secs:02d}"